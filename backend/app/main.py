@@ -3,136 +3,335 @@ AgroIrriga Pro - Backend API
 FastAPI + PostgreSQL + MQTT + Machine Learning
 """
 
-from fastapi import FastAPI, HTTPException, BackgroundTasks, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, HTTPException, BackgroundTasks, WebSocket, WebSocketDisconnect, Depends
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from starlette.background import BackgroundTask
 from contextlib import asynccontextmanager
 import asyncio
-import json
+import os
+import time
+import orjson
 from datetime import datetime, timedelta
 from typing import List, Optional
-import paho.mqtt.client as mqtt
+import aiomqtt
+from arq import create_pool
+from arq.connections import RedisSettings
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from apscheduler.triggers.cron import CronTrigger
 import joblib
 import numpy as np
-from sqlalchemy.orm import Session
-
-from .database import SessionLocal, engine, Base
+try:
+    from numba import njit
+except ImportError:  # numba opcional: mesmas funções em Python puro
+    def njit(*args, **kwargs):
+        return lambda func: func
+from functools import lru_cache
+from sqlalchemy import select, insert, func, literal_column, bindparam, text
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.pool import NullPool
+
+from .database import DATABASE_URL, get_db, get_engine, get_sessionmaker, init_db, close_db
 from .models import (
     SolenoidState, WeatherReading, IrrigationEvent,
     IrrigationSchedule, FarmZone
 )
-from .schemas import (
-    ValveCommand, ValveStatus, WeatherData, 
-    IrrigationRequest, AutomationRule
-)
-
-# Cria tabelas
-Base.metadata.create_all(bind=engine)
+from .schemas import ValveCommand, IrrigationScheduleCreate
+from .worker import REDIS_URL
 
-# MQTT Client global
+# MQTT Client global (None enquanto desconectado)
 mqtt_client = None
-connected_clients = []
+MQTT_COMMAND_TOPIC = "agroirriga/agroirriga_fazenda_01/command"
+MQTT_RECONNECT_MAX = 60  # segundos entre tentativas, no máximo
+connected_clients = {}  # WebSocket -> fila de saída do client
+
+# Mensagens pendentes por client; se encher, descarta a mais antiga
+WS_QUEUE_SIZE = 256
+
+MQTT_SHARE_GROUP = "$share/agroirriga_backend"
+
+# Canal Redis que replica os broadcasts WebSocket entre workers
+WS_BROADCAST_CHANNEL = "agroirriga:ws_broadcast"
+
+# Fila de mensagens MQTT (leitor -> consumidor)
+mqtt_queue: Optional[asyncio.Queue] = None
+
+# Lote de estados de válvulas: grava a cada N linhas ou a cada intervalo
+VALVE_BATCH_SIZE = 500
+VALVE_FLUSH_INTERVAL = 0.1  # segundos
+
+# Pontos máximos retornados pelo histórico meteorológico
+HISTORY_MAX_POINTS = 288
+
+# Cache da última leitura meteorológica; atualizado a cada ingestão MQTT.
+# O TTL cobre leituras recebidas por outros workers
+WEATHER_CACHE_TTL = 60  # segundos
 
 # Modelo ML (carregado na inicialização)
 ml_model = None
 
+# Fila de jobs arq (notificações são enviadas pelo worker)
+arq_pool = None
+
+# Consultas fixas construídas uma única vez (SQL compilado fica em cache)
+_LATEST_WEATHER = (
+    select(WeatherReading)
+    .order_by(WeatherReading.timestamp.desc())
+    .limit(1)
+)
+_LATEST_VALVE_STATES = (
+    select(SolenoidState)
+    .distinct(SolenoidState.valve_number)
+    .order_by(SolenoidState.valve_number, SolenoidState.timestamp.desc())
+)
+_FARM_ZONES = select(FarmZone).order_by(FarmZone.id)
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
-    global mqtt_client, ml_model
+    global ml_model, mqtt_queue, arq_pool
     
-    # Conecta MQTT
-    mqtt_client = mqtt.Client(client_id="agroirriga_backend")
-    mqtt_client.on_connect = on_mqtt_connect
-    mqtt_client.on_message = on_mqtt_message
-    mqtt_client.connect("localhost", 1883, 60)
-    mqtt_client.loop_start()
+    # Cria tabelas
+    await init_db()
+    set_latest_weather(None)
+    app.state.features_buf = None
     
     # Carrega modelo ML (se existir)
     try:
         ml_model = joblib.load("models/irrigation_predictor.pkl")
         print("✅ Modelo ML carregado")
-    except:
-        print("⚠️ Modelo ML não encontrado, usando regras heurísticas")
+    except Exception as e:
+        print(f"⚠️ Modelo ML não encontrado, usando regras heurísticas: {e}")
         ml_model = None
     
-    # Inicia tarefas periódicas
-    asyncio.create_task(weather_scheduler())
-    asyncio.create_task(ml_irrigation_advisor())
+    # Inferência de aquecimento: a primeira chamada real não paga o custo inicial.
+    # Falha aqui indica modelo incompatível com as features (N_FEATURES)
+    if ml_model is not None:
+        try:
+            warmup = feature_buffer()
+            warmup.fill(0)
+            ml_model.predict_proba(warmup)
+        except Exception as e:
+            print(f"⚠️ Modelo ML incompatível ({N_FEATURES} features), "
+                  f"usando regras heurísticas: {e}")
+            ml_model = None
+    
+    # Conecta à fila de notificações (se o Redis estiver disponível)
+    try:
+        arq_pool = await create_pool(RedisSettings.from_dsn(REDIS_URL))
+    except Exception as e:
+        print(f"⚠️ Redis indisponível, notificações desativadas: {e}")
+        arq_pool = None
+    
+    # Broadcasts WebSocket chegam por aqui, venham de qualquer worker
+    listener_task = asyncio.create_task(broadcast_listener()) if arq_pool else None
+    
+    # Conecta MQTT no mesmo event loop da API (reconecta sozinho se cair)
+    mqtt_queue = asyncio.Queue()
+    consumer_task = asyncio.create_task(mqtt_consumer())
+    reader_task = asyncio.create_task(mqtt_connection())
+    
+    # Inicia tarefas periódicas (apenas no worker líder)
+    leader_task = asyncio.create_task(scheduler_leader())
     
     yield
     
     # Shutdown
-    mqtt_client.loop_stop()
-    mqtt_client.disconnect()
+    leader_task.cancel()
+    await asyncio.gather(leader_task, return_exceptions=True)
+    reader_task.cancel()
+    await asyncio.gather(reader_task, return_exceptions=True)
+    
+    # Sentinela: o consumidor grava o que resta na fila e encerra
+    mqtt_queue.put_nowait(None)
+    await asyncio.gather(consumer_task, return_exceptions=True)
+    
+    if listener_task:
+        listener_task.cancel()
+        await asyncio.gather(listener_task, return_exceptions=True)
+    if arq_pool:
+        await arq_pool.close()
+    await close_db()
 
 app = FastAPI(
     title="AgroIrriga Pro API",
     description="API para controle de irrigação automatizada",
     version="2.0.0",
+    default_response_class=ORJSONResponse,
     lifespan=lifespan
 )
 
-# CORS para frontend
+# CORS para frontend (domínios separados por vírgula em CORS_ORIGINS).
+# Sem a variável, libera apenas o painel servido localmente na porta 8080
+DEV_CORS_ORIGINS = "http://localhost:8080,http://127.0.0.1:8080"
+if not os.getenv("CORS_ORIGINS"):
+    print(f"⚠️ CORS_ORIGINS não definido, usando origens de desenvolvimento: {DEV_CORS_ORIGINS}")
+CORS_ORIGINS = [
+    origin.strip()
+    for origin in (os.getenv("CORS_ORIGINS") or DEV_CORS_ORIGINS).split(",")
+    if origin.strip()
+]
+
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"],  # Em produção, especificar domínios
+    allow_origins=CORS_ORIGINS,
     allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+    allow_methods=["GET", "POST"],
+    allow_headers=["authorization", "content-type"],
+    max_age=86400,  # cache do preflight no navegador
 )
 
 # ============ MQTT HANDLERS ============
 
-def on_mqtt_connect(client, userdata, flags, rc):
-    print(f"🔗 MQTT Conectado (código {rc})")
-    # Subscreve em tópicos dos dispositivos
-    client.subscribe("agroirriga/+/status")
-    client.subscribe("agroirriga/+/weather")
-    client.subscribe("agroirriga/+/alerts")
+async def mqtt_connection():
+    """Mantém a conexão MQTT; o aiomqtt não reconecta por conta própria"""
+    global mqtt_client
+    backoff = 1
+    
+    while True:
+        try:
+            # ID único por worker (uvicorn --workers N), senão o broker derruba os demais
+            async with aiomqtt.Client(
+                "localhost", 1883, identifier=f"agroirriga_backend_{os.getpid()}", keepalive=60
+            ) as client:
+                mqtt_client = client
+                await on_mqtt_connect(client)
+                backoff = 1
+                await mqtt_reader(client)
+        except aiomqtt.MqttError as e:
+            print(f"⚠️ MQTT desconectado ({e}), nova tentativa em {backoff}s")
+        except Exception as e:
+            print(f"❌ Erro MQTT: {e}, nova tentativa em {backoff}s")
+        finally:
+            mqtt_client = None
+        
+        await asyncio.sleep(backoff)
+        backoff = min(backoff * 2, MQTT_RECONNECT_MAX)
 
-def on_mqtt_message(client, userdata, msg):
+class MqttUnavailableError(Exception):
+    """Broker MQTT fora do ar: o comando não foi enviado"""
+
+async def publish_command(payload: dict, qos: int = 0):
+    """Publica comando para o ESP32"""
+    if mqtt_client is None:
+        raise MqttUnavailableError("Broker MQTT indisponível")
     try:
-        topic = msg.topic
-        payload = json.loads(msg.payload.decode())
-        
-        print(f"📨 MQTT: {topic}")
-        
-        # Salva no banco de dados
-        db = SessionLocal()
-        
-        if "status" in topic:
-            save_valve_status(db, payload)
-        elif "weather" in topic:
-            save_weather_data(db, payload)
-        elif "alerts" in topic:
-            handle_alert(db, payload)
-        
-        db.close()
-        
-        # Notifica clients WebSocket
-        asyncio.create_task(notify_clients({
-            "type": "mqtt_update",
-            "topic": topic,
-            "data": payload
-        }))
-        
+        await mqtt_client.publish(MQTT_COMMAND_TOPIC, orjson.dumps(payload), qos=qos)
+    except aiomqtt.MqttError as e:
+        raise MqttUnavailableError(f"Falha ao publicar comando: {e}") from e
+
+async def publish_command_or_503(payload: dict, qos: int = 0):
+    """publish_command para endpoints: broker indisponível vira 503"""
+    try:
+        await publish_command(payload, qos=qos)
+    except MqttUnavailableError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+async def on_mqtt_connect(client: aiomqtt.Client):
+    print("🔗 MQTT Conectado")
+    # Subscreve em tópicos dos dispositivos. Assinatura compartilhada:
+    # com vários workers, cada mensagem é entregue a apenas um deles
+    # (os dashboards de todos recebem via WS_BROADCAST_CHANNEL)
+    await client.subscribe(f"{MQTT_SHARE_GROUP}/agroirriga/+/status")
+    await client.subscribe(f"{MQTT_SHARE_GROUP}/agroirriga/+/weather")
+    await client.subscribe(f"{MQTT_SHARE_GROUP}/agroirriga/+/alerts")
+
+async def mqtt_reader(client: aiomqtt.Client):
+    """Lê mensagens do broker e repassa para o consumidor"""
+    async for msg in client.messages:
+        try:
+            payload = orjson.loads(msg.payload)
+            mqtt_queue.put_nowait((msg.topic.value, payload))
+        except Exception as e:
+            print(f"❌ Erro MQTT: {e}")
+
+async def mqtt_consumer():
+    """Consome a fila MQTT no event loop usando a sessão assíncrona"""
+    loop = asyncio.get_running_loop()
+    pending_states = []
+    flush_at = None
+    
+    try:
+        while True:
+            timeout = None
+            if pending_states:
+                timeout = max(0, flush_at - loop.time())
+            
+            try:
+                item = await asyncio.wait_for(mqtt_queue.get(), timeout)
+            except asyncio.TimeoutError:
+                await flush_valve_states(pending_states)
+                pending_states = []
+                continue
+            
+            if item is None:
+                # Shutdown: fila drenada
+                break
+            topic, payload = item
+            
+            try:
+                print(f"📨 MQTT: {topic}")
+                
+                # Salva no banco de dados
+                if "status" in topic:
+                    # Estados de válvulas são acumulados e gravados em lote
+                    if not pending_states:
+                        flush_at = loop.time() + VALVE_FLUSH_INTERVAL
+                    pending_states.extend(valve_state_rows(payload))
+                    if len(pending_states) >= VALVE_BATCH_SIZE:
+                        await flush_valve_states(pending_states)
+                        pending_states = []
+                else:
+                    async with get_sessionmaker()() as db:
+                        if "weather" in topic:
+                            await save_weather_data(db, payload)
+                        elif "alerts" in topic:
+                            await handle_alert(db, payload)
+                
+                # Notifica clients WebSocket
+                await notify_clients({
+                    "type": "mqtt_update",
+                    "topic": topic,
+                    "data": payload
+                })
+                
+            except Exception as e:
+                print(f"❌ Erro MQTT: {e}")
+    finally:
+        # Não perde o lote pendente no shutdown
+        if pending_states:
+            await flush_valve_states(pending_states)
+
+async def flush_valve_states(rows: list):
+    """Grava o lote pendente de estados de válvulas"""
+    try:
+        async with get_sessionmaker()() as db:
+            await save_valve_status(db, rows)
     except Exception as e:
-        print(f"❌ Erro MQTT: {e}")
-
-def save_valve_status(db: Session, data: dict):
-    """Salva estado das válvulas no banco"""
-    for valve_data in data.get("valves", []):
-        state = SolenoidState(
-            valve_number=valve_data["number"],
-            state=valve_data["state"] == "ON",
-            timestamp=datetime.utcnow(),
-            device_id=data.get("device_id", "unknown")
-        )
-        db.add(state)
-    db.commit()
+        print(f"❌ Erro ao gravar estados: {e}")
+
+def valve_state_rows(data: dict) -> list:
+    """Converte payload de status em linhas de solenoid_states"""
+    now = datetime.utcnow()
+    device_id = data.get("device_id", "unknown")
+    return [
+        {
+            "valve_number": v["number"],
+            "state": v["state"] == "ON",
+            "timestamp": now,
+            "device_id": device_id
+        }
+        for v in data.get("valves", [])
+    ]
 
-def save_weather_data(db: Session, data: dict):
+async def save_valve_status(db: AsyncSession, rows: list):
+    """Salva estado das válvulas no banco (um único INSERT multi-values)"""
+    if not rows:
+        return
+    await db.execute(insert(SolenoidState).values(rows))
+    await db.commit()
+
+async def save_weather_data(db: AsyncSession, data: dict):
     """Salva leitura meteorológica"""
     weather = WeatherReading(
         temperature=data.get("temperature"),
@@ -145,30 +344,53 @@ def save_weather_data(db: Session, data: dict):
         device_id=data.get("device_id", "unknown")
     )
     db.add(weather)
-    db.commit()
+    await db.commit()
+    set_latest_weather(weather)
+
+async def get_latest_weather(db: AsyncSession):
+    """Última leitura meteorológica, servida do cache enquanto válida"""
+    cached = app.state.latest_weather
+    if cached is not None and time.monotonic() - app.state.latest_weather_at < WEATHER_CACHE_TTL:
+        return cached
+    
+    weather = (await db.scalars(_LATEST_WEATHER)).first()
+    
+    # Uma ingestão durante a consulta pode ter gravado leitura mais nova
+    current = app.state.latest_weather
+    if current is not None and (weather is None or current.timestamp >= weather.timestamp):
+        weather = current
+    
+    set_latest_weather(weather)
+    return weather
 
-def handle_alert(db: Session, data: dict):
-    """Processa alertas do hardware"""
+def set_latest_weather(weather: Optional[WeatherReading]):
+    app.state.latest_weather = weather
+    app.state.latest_weather_at = time.monotonic()
+
+async def handle_alert(db: AsyncSession, data: dict):
+    """Processa alertas do hardware (envio fica com o worker arq)"""
     print(f"🚨 ALERTA: {data.get('alert_type')} - Válvula {data.get('valve')}")
-    # Aqui você pode enviar email, SMS, notificação push, etc.
+    if arq_pool:
+        await arq_pool.enqueue_job("send_alert", data)
 
 # ============ API ENDPOINTS ============
 
-@app.get("/")
+@app.get("/", response_model=None)
 async def root():
-    return {
+    return ORJSONResponse({
         "message": "AgroIrriga Pro API",
         "version": "2.0.0",
         "status": "operational"
-    }
+    })
 
 # ---- Controle de Válvulas ----
 
-@app.post("/api/valves/{valve_number}/control")
+@app.post("/api/valves/{valve_number}/control", response_model=None)
 async def control_valve(
     valve_number: int,
     command: ValveCommand,
-    background_tasks: BackgroundTasks
+    background_tasks: BackgroundTasks,
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Controla uma válvula específica (1-10)
@@ -185,13 +407,9 @@ async def control_valve(
         "source": "web_api"
     }
     
-    mqtt_client.publish(
-        f"agroirriga/agroirriga_fazenda_01/command",
-        json.dumps(mqtt_payload)
-    )
+    await publish_command_or_503(mqtt_payload)
     
     # Log no banco
-    db = SessionLocal()
     event = IrrigationEvent(
         valve_number=valve_number,
         action="ON" if command.state else "OFF",
@@ -200,17 +418,16 @@ async def control_valve(
         timestamp=datetime.utcnow()
     )
     db.add(event)
-    db.commit()
-    db.close()
+    await db.commit()
     
-    return {
+    return ORJSONResponse({
         "success": True,
         "valve": valve_number,
         "state": "ON" if command.state else "OFF",
         "message": f"Válvula {valve_number} {'ligada' if command.state else 'desligada'}"
-    }
+    })
 
-@app.post("/api/valves/all-off")
+@app.post("/api/valves/all-off", response_model=None)
 async def all_valves_off():
     """Desliga todas as válvulas de emergência"""
     mqtt_payload = {
@@ -218,43 +435,38 @@ async def all_valves_off():
         "timestamp": datetime.utcnow().isoformat()
     }
     
-    mqtt_client.publish(
-        f"agroirriga/agroirriga_fazenda_01/command",
-        json.dumps(mqtt_payload)
-    )
+    await publish_command_or_503(mqtt_payload)
     
-    return {"success": True, "message": "Comando enviado: desligar todas"}
+    return ORJSONResponse({"success": True, "message": "Comando enviado: desligar todas"})
 
-@app.get("/api/valves/status")
-async def get_valves_status():
+@app.get("/api/valves/status", response_model=None)
+async def get_valves_status(db: AsyncSession = Depends(get_db)):
     """Retorna status atual de todas as válvulas"""
-    db = SessionLocal()
+    # Último estado de cada válvula em uma única consulta (DISTINCT ON)
+    rows = (await db.scalars(_LATEST_VALVE_STATES)).all()
+    by_valve = {row.valve_number: row for row in rows}
     
-    # Último estado de cada válvula
     latest_states = {}
     for i in range(1, 11):
-        state = db.query(SolenoidState).filter(
-            SolenoidState.valve_number == i
-        ).order_by(SolenoidState.timestamp.desc()).first()
-        
+        state = by_valve.get(i)
         latest_states[i] = {
             "valve": i,
             "state": state.state if state else False,
             "last_change": state.timestamp.isoformat() if state else None
         }
     
-    db.close()
-    return {"valves": list(latest_states.values())}
+    return ORJSONResponse({"valves": list(latest_states.values())})
 
 # ---- Automação Inteligente ----
 
-@app.post("/api/irrigation/schedule")
-async def schedule_irrigation(schedule: IrrigationSchedule):
+@app.post("/api/irrigation/schedule", response_model=None)
+async def schedule_irrigation(
+    schedule: IrrigationScheduleCreate,
+    db: AsyncSession = Depends(get_db)
+):
     """
     Agenda irrigação automática baseada em horário ou condições
     """
-    db = SessionLocal()
-    
     sched = IrrigationSchedule(
         valve_number=schedule.valve_number,
         start_time=schedule.start_time,
@@ -264,9 +476,11 @@ async def schedule_irrigation(schedule: IrrigationSchedule):
         weather_dependent=schedule.weather_dependent
     )
     db.add(sched)
-    db.commit()
+    await db.commit()
     
-    # Se ativo, envia para ESP32
+    # Se ativo, envia para ESP32. O agendamento já está salvo: com o broker
+    # fora do ar responde sent=false (repetir a chamada duplicaria o registro)
+    sent = False
     if schedule.active:
         mqtt_payload = {
             "action": "schedule_irrigation",
@@ -275,49 +489,40 @@ async def schedule_irrigation(schedule: IrrigationSchedule):
             "start_hour": schedule.start_time.hour,
             "start_minute": schedule.start_time.minute
         }
-        mqtt_client.publish(
-            f"agroirriga/agroirriga_fazenda_01/command",
-            json.dumps(mqtt_payload)
-        )
+        try:
+            await publish_command(mqtt_payload)
+            sent = True
+        except MqttUnavailableError as e:
+            print(f"⚠️ Agendamento {sched.id} salvo, mas não enviado ao ESP32: {e}")
     
-    db.close()
-    return {"success": True, "schedule_id": sched.id}
+    return ORJSONResponse({"success": True, "schedule_id": sched.id, "sent": sent})
 
-@app.post("/api/irrigation/smart")
-async def smart_irrigation(zone_id: int):
+@app.post("/api/irrigation/smart", response_model=None)
+async def smart_irrigation(zone_id: int, db: AsyncSession = Depends(get_db)):
     """
     Ativa irrigação inteligente baseada em ML
     Analisa: NDVI, umidade do solo, previsão do tempo, histórico
     """
-    db = SessionLocal()
-    
     # Coleta dados para decisão
-    weather = db.query(WeatherReading).order_by(
-        WeatherReading.timestamp.desc()
-    ).first()
+    weather = await get_latest_weather(db)
     
-    # Últimos eventos de irrigação
-    last_irrigation = db.query(IrrigationEvent).filter(
-        IrrigationEvent.zone_id == zone_id
-    ).order_by(IrrigationEvent.timestamp.desc()).first()
+    # Válvulas da zona (padrão da decisão se a zona não estiver cadastrada)
+    zone = await db.get(FarmZone, zone_id)
     
     # Decisão ML ou heurística
-    decision = make_irrigation_decision(weather, last_irrigation, ml_model)
-    
-    if decision["should_irrigate"]:
-        # Liga válvulas da zona
-        valves = decision["valves_to_open"]
-        for valve in valves:
-            mqtt_payload = {
-                "action": "valve_on",
-                "valve": valve,
-                "duration": decision["duration_minutes"],
-                "reason": "ml_recommendation"
-            }
-            mqtt_client.publish(
-                f"agroirriga/agroirriga_fazenda_01/command",
-                json.dumps(mqtt_payload)
-            )
+    decision = make_irrigation_decision(
+        weather, (zone.valves or []) if zone else None, ml_model
+    )
+    
+    if decision["should_irrigate"] and decision["valves_to_open"]:
+        # Liga válvulas da zona em um único comando
+        mqtt_payload = {
+            "action": "valves_on_bulk",
+            "valves": decision["valves_to_open"],
+            "duration": decision["duration_minutes"],
+            "reason": "ml_recommendation"
+        }
+        await publish_command_or_503(mqtt_payload, qos=1)
         
         # Log
         event = IrrigationEvent(
@@ -329,56 +534,107 @@ async def smart_irrigation(zone_id: int):
             timestamp=datetime.utcnow()
         )
         db.add(event)
-        db.commit()
+        await db.commit()
     
-    db.close()
-    
-    return {
+    return ORJSONResponse({
         "decision": decision["should_irrigate"],
         "confidence": decision["confidence"],
         "reason": decision["reason"],
         "valves": decision.get("valves_to_open", []),
         "duration": decision.get("duration_minutes", 0)
-    }
+    })
+
+# Features do modelo: temperatura, umidade, chuva 1h
+N_FEATURES = 3
 
-def make_irrigation_decision(weather, last_irrigation, model):
+def make_irrigation_decision(weather, zone_valves, model):
     """Lógica de decisão de irrigação"""
+    return make_irrigation_decisions(weather, [zone_valves], model)[0]
+
+def make_irrigation_decisions(weather, zone_valves: list, model) -> list:
+    """Decide para várias zonas de uma vez.
+    
+    As features são só meteorológicas e iguais para todas as zonas, então o
+    modelo roda uma única vez; cada zona recebe as próprias válvulas.
+    None = zona não cadastrada (usa as válvulas padrão da decisão); lista
+    vazia = zona cadastrada sem válvulas (nenhuma válvula é aberta).
+    """
+    if not zone_valves:
+        return []
     
     # Se tem modelo ML, usa ele
     if model:
-        features = np.array([
-            weather.temperature if weather else 25,
-            weather.humidity if weather else 60,
-            weather.rain_1h if weather else 0,
-            # ... mais features
-        ]).reshape(1, -1)
-        
-        prediction = model.predict(features)[0]
-        confidence = model.predict_proba(features)[0].max()
-        
-        return {
-            "should_irrigate": prediction == 1,
-            "confidence": float(confidence),
-            "reason": "ml_prediction",
-            "valves_to_open": [1, 2, 3],  # Determinado pela zona
-            "duration_minutes": 30
-        }
+        decision = ml_decision(weather, model)
+    else:
+        decision = heuristic_decision(weather)
+    
+    return [
+        dict(
+            decision,
+            valves_to_open=list(decision["valves_to_open"] if valves is None else valves)
+            if decision["should_irrigate"] else []
+        )
+        for valves in zone_valves
+    ]
+
+def ml_decision(weather, model):
+    """Decisão pelo modelo ML (predict_proba uma vez; a classe sai do argmax)"""
+    features = feature_buffer()
+    features[0, 0] = weather.temperature if weather else 25
+    features[0, 1] = weather.humidity if weather else 60
+    features[0, 2] = weather.rain_1h if weather else 0
+    # ... mais features
     
-    # Fallback: regras heurísticas
-    should_irrigate = False
-    reason = ""
+    proba = model.predict_proba(features)[0]
+    prediction = model.classes_[proba.argmax()]
     
+    return {
+        "should_irrigate": bool(prediction == 1),
+        "confidence": float(proba.max()),
+        "reason": "ml_prediction",
+        "valves_to_open": [1, 2, 3],  # Padrão quando a zona não define válvulas
+        "duration_minutes": 30
+    }
+
+def feature_buffer() -> np.ndarray:
+    """Buffer float32 de features reutilizado entre inferências"""
+    if app.state.features_buf is None:
+        app.state.features_buf = np.empty((1, N_FEATURES), dtype=np.float32)
+    return app.state.features_buf
+
+# Códigos de motivo retornados por _decide
+REASON_NONE, REASON_RAIN, REASON_HUMIDITY, REASON_STRESS = 0, 1, 2, 3
+HEURISTIC_REASONS = (
+    "",
+    "Chuva recente detectada",
+    "Umidade ambiente alta",
+    "Condições de estresse hídrico",
+)
+
+# float64 como os valores lidos do banco: sem arredondamento nos limiares.
+# Sem fastmath, comparações com NaN (sensor sem leitura) seguem IEEE
+@njit("int8(float64, float64, float64)", cache=True)
+def _decide(temperature, humidity, rain_1h):
+    """Regras heurísticas puramente numéricas (compiladas no import)"""
+    # Não irrigar se choveu nas últimas 6 horas
+    if rain_1h > 5:
+        return REASON_RAIN
+    # Não irrigar se umidade > 70%
+    if humidity > 70:
+        return REASON_HUMIDITY
+    # Irrigar se temperatura > 30 e umidade < 40
+    if temperature > 30 and humidity < 40:
+        return REASON_STRESS
+    return REASON_NONE
+
+def heuristic_decision(weather):
+    """Fallback: regras heurísticas"""
+    code = REASON_NONE
     if weather:
-        # Não irrigar se choveu nas últimas 6 horas
-        if weather.rain_1h > 5:
-            reason = "Chuva recente detectada"
-        # Não irrigar se umidade > 70%
-        elif weather.humidity > 70:
-            reason = "Umidade ambiente alta"
-        # Irrigar se temperatura > 30 e umidade < 40
-        elif weather.temperature > 30 and weather.humidity < 40:
-            should_irrigate = True
-            reason = "Condições de estresse hídrico"
+        code = _decide(weather.temperature, weather.humidity, weather.rain_1h)
+    
+    should_irrigate = code == REASON_STRESS
+    reason = HEURISTIC_REASONS[code]
     
     return {
         "should_irrigate": should_irrigate,
@@ -390,19 +646,15 @@ def make_irrigation_decision(weather, last_irrigation, model):
 
 # ---- Dados Meteorológicos ----
 
-@app.get("/api/weather/current")
-async def get_current_weather():
+@app.get("/api/weather/current", response_model=None)
+async def get_current_weather(db: AsyncSession = Depends(get_db)):
     """Retorna dados meteorológicos mais recentes"""
-    db = SessionLocal()
-    weather = db.query(WeatherReading).order_by(
-        WeatherReading.timestamp.desc()
-    ).first()
-    db.close()
+    weather = await get_latest_weather(db)
     
     if not weather:
         raise HTTPException(status_code=404, detail="Sem dados meteorológicos")
     
-    return {
+    return ORJSONResponse({
         "temperature": weather.temperature,
         "humidity": weather.humidity,
         "pressure": weather.pressure,
@@ -410,39 +662,83 @@ async def get_current_weather():
         "rain_1h": weather.rain_1h,
         "solar_radiation": weather.solar_radiation,
         "timestamp": weather.timestamp.isoformat()
-    }
+    })
+
+@lru_cache(maxsize=32)
+def weather_history_stmt(bucket_minutes: int):
+    """Consulta agregada do histórico, construída uma vez por largura de intervalo"""
+    bucket = func.date_bin(
+        literal_column(f"interval '{bucket_minutes} minutes'"),
+        WeatherReading.timestamp,
+        literal_column("timestamp '2000-01-01'")
+    ).label("bucket")
+    
+    return (
+        select(
+            bucket,
+            func.avg(WeatherReading.temperature).label("temperature"),
+            func.avg(WeatherReading.humidity).label("humidity"),
+            # rain_1h já é acumulado de 1h: o máximo do intervalo, não a soma
+            func.max(WeatherReading.rain_1h).label("rain")
+        )
+        .where(WeatherReading.timestamp >= bindparam("since"))
+        .group_by(bucket)
+        .order_by(bucket)
+    )
 
-@app.get("/api/weather/history")
+@app.get("/api/weather/history", response_model=None)
 async def get_weather_history(hours: int = 24):
-    """Histórico de dados meteorológicos"""
-    db = SessionLocal()
+    """Histórico de dados meteorológicos (agregado em intervalos no banco)"""
     since = datetime.utcnow() - timedelta(hours=hours)
     
-    readings = db.query(WeatherReading).filter(
-        WeatherReading.timestamp >= since
-    ).order_by(WeatherReading.timestamp.asc()).all()
-    
-    db.close()
+    # Intervalo de 5 min, aumentado para janelas longas (~288 pontos no máximo)
+    bucket_minutes = max(5, hours * 60 // HISTORY_MAX_POINTS)
     
-    return {
-        "count": len(readings),
-        "data": [
-            {
-                "timestamp": r.timestamp.isoformat(),
-                "temperature": r.temperature,
-                "humidity": r.humidity,
-                "rain": r.rain_1h
-            }
-            for r in readings
-        ]
-    }
+    # Consulta executada antes de enviar os headers: falhas viram 500,
+    # não um 200 com JSON truncado. Só a leitura das linhas é transmitida
+    db = get_sessionmaker()()
+    try:
+        result = await db.stream(
+            weather_history_stmt(bucket_minutes), {"since": since}
+        )
+    except Exception:
+        await db.close()
+        raise
+    
+    return StreamingResponse(
+        stream_weather_history(db, result, bucket_minutes),
+        media_type="application/json",
+        # Fecha a sessão mesmo se o corpo não chegar a ser gerado
+        background=BackgroundTask(db.close)
+    )
+
+async def stream_weather_history(db: AsyncSession, result, bucket_minutes: int):
+    """Gera o JSON do histórico linha a linha, direto do cursor do banco"""
+    try:
+        yield b'{"bucket_minutes":%d,"data":[' % bucket_minutes
+        count = 0
+        async for r in result.mappings():
+            chunk = orjson.dumps({
+                "timestamp": r["bucket"].isoformat(),
+                "temperature": r["temperature"],
+                "humidity": r["humidity"],
+                "rain": r["rain"]
+            })
+            yield chunk if count == 0 else b"," + chunk
+            count += 1
+        yield b'],"count":%d}' % count
+    finally:
+        await result.close()
+        await db.close()
 
 # ---- WebSocket para Realtime ----
 
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
     await websocket.accept()
-    connected_clients.append(websocket)
+    queue = asyncio.Queue(maxsize=WS_QUEUE_SIZE)
+    connected_clients[websocket] = queue
+    sender_task = asyncio.create_task(websocket_sender(websocket, queue))
     
     try:
         while True:
@@ -451,44 +747,190 @@ async def websocket_endpoint(websocket: WebSocket):
             # Ou apenas mantém conexão para pushes do servidor
             
     except WebSocketDisconnect:
-        connected_clients.remove(websocket)
+        pass
+    finally:
+        connected_clients.pop(websocket, None)
+        sender_task.cancel()
+
+async def websocket_sender(websocket: WebSocket, queue: asyncio.Queue):
+    """Tarefa única por client: drena a fila e envia em ordem"""
+    try:
+        while True:
+            text = await queue.get()
+            await websocket.send_text(text)
+    except Exception:
+        # Client desconectado: para de receber broadcasts
+        connected_clients.pop(websocket, None)
 
 async def notify_clients(message: dict):
-    """Envia mensagem para todos clients WebSocket conectados"""
-    disconnected = []
-    for client in connected_clients:
+    """Envia mensagem aos dashboards de todos os workers"""
+    # Serializa uma única vez para todos os clients
+    data = orjson.dumps(message)
+    
+    # Com Redis, o broadcast passa pelo pub/sub e cada worker entrega aos seus
+    if arq_pool:
         try:
-            await client.send_json(message)
-        except:
-            disconnected.append(client)
+            await arq_pool.publish(WS_BROADCAST_CHANNEL, data)
+            return
+        except Exception as e:
+            print(f"⚠️ Falha no broadcast via Redis, entregando localmente: {e}")
     
-    # Remove clients desconectados
-    for client in disconnected:
-        if client in connected_clients:
-            connected_clients.remove(client)
+    push_local_clients(data.decode())
+
+async def broadcast_listener():
+    """Repassa aos clients deste worker os broadcasts publicados no Redis"""
+    while True:
+        pubsub = arq_pool.pubsub()
+        try:
+            await pubsub.subscribe(WS_BROADCAST_CHANNEL)
+            async for msg in pubsub.listen():
+                if msg["type"] == "message":
+                    data = msg["data"]
+                    push_local_clients(data.decode() if isinstance(data, bytes) else data)
+        except Exception as e:
+            print(f"⚠️ Pub/sub Redis interrompido ({e}), nova tentativa em 1s")
+        finally:
+            await pubsub.close()
+        await asyncio.sleep(1)
+
+def push_local_clients(text: str):
+    """Enfileira mensagem para os clients WebSocket conectados a este worker"""
+    for queue in connected_clients.values():
+        if queue.full():
+            # Client lento: descarta a mensagem mais antiga
+            queue.get_nowait()
+        queue.put_nowait(text)
 
 # ============ TAREFAS PERIÓDICAS ============
 
-async def weather_scheduler():
-    """Agendador para requisitar dados meteorológicos"""
-    while True:
-        await asyncio.sleep(7200)  # 2 horas
-        
-        # Envia comando para ESP32 ler estação
-        mqtt_payload = {
-            "action": "read_weather_now",
-            "timestamp": datetime.utcnow().isoformat()
-        }
-        mqtt_client.publish(
-            f"agroirriga/agroirriga_fazenda_01/command",
-            json.dumps(mqtt_payload)
-        )
+# Tabelas particionadas por mês (backend/migrations/002_partition_time_series.sql)
+PARTITIONED_TABLES = ("solenoid_states", "weather_readings")
+
+# Advisory lock que elege o worker responsável pelo agendador
+SCHEDULER_LOCK_KEY = 72_400_001
+SCHEDULER_LOCK_CHECK = 60  # segundos
+
+async def scheduler_leader():
+    """Roda o agendador só no worker que obtém o advisory lock no PostgreSQL"""
+    # Conexão própria, fora do pool: se o worker cair, o lock cai junto
+    engine = create_async_engine(
+        DATABASE_URL, poolclass=NullPool, isolation_level="AUTOCOMMIT"
+    )
+    try:
+        while True:
+            try:
+                async with engine.connect() as conn:
+                    acquired = await conn.scalar(
+                        text("SELECT pg_try_advisory_lock(:key)"),
+                        {"key": SCHEDULER_LOCK_KEY}
+                    )
+                    if acquired:
+                        print("⏰ Este worker executa as tarefas agendadas")
+                        scheduler = create_scheduler()
+                        scheduler.start()
+                        try:
+                            # Mantém a conexão (e o lock) ativa
+                            while True:
+                                await asyncio.sleep(SCHEDULER_LOCK_CHECK)
+                                await conn.execute(text("SELECT 1"))
+                        finally:
+                            scheduler.shutdown(wait=False)
+            except Exception as e:
+                print(f"⚠️ Agendador: conexão perdida ({e})")
+            
+            # Outro worker é o líder (ou a conexão caiu): tenta de novo depois
+            await asyncio.sleep(SCHEDULER_LOCK_CHECK)
+    finally:
+        await engine.dispose()
+
+def create_scheduler() -> AsyncIOScheduler:
+    """Agendador cron em memória; roda só no worker líder (ver scheduler_leader).
+    
+    Os gatilhos cron seguem o relógio, então reinícios não mudam a fase dos
+    jobs; execuções perdidas com a API parada não são repostas.
+    """
+    scheduler = AsyncIOScheduler(
+        job_defaults={"coalesce": True, "misfire_grace_time": 300}
+    )
+    # Horários defasados + jitter para não gerar rajadas de MQTT
+    scheduler.add_job(
+        poll_weather, CronTrigger(hour="*/2", minute=0, jitter=30),
+        id="poll_weather", replace_existing=True
+    )
+    scheduler.add_job(
+        run_ml_advisor, CronTrigger(hour="*/6", minute=30, jitter=60),
+        id="run_ml_advisor", replace_existing=True
+    )
+    # Diário e também na partida: a partição do mês seguinte existe com folga
+    scheduler.add_job(
+        create_next_partitions, CronTrigger(hour=3, minute=15, jitter=60),
+        id="create_next_partitions", replace_existing=True,
+        next_run_time=datetime.now()
+    )
+    return scheduler
+
+async def create_next_partitions():
+    """Cria as partições mensais atual e seguinte (migração 002)"""
+    try:
+        async with get_engine().begin() as conn:
+            installed = await conn.scalar(text(
+                "SELECT to_regprocedure('create_monthly_partition(text, date)') IS NOT NULL"
+            ))
+            if not installed:
+                return
+            
+            for table in PARTITIONED_TABLES:
+                await conn.execute(
+                    text("SELECT create_monthly_partition(:table, now()::date)"),
+                    {"table": table}
+                )
+                await conn.execute(
+                    text("SELECT create_monthly_partition(:table, (now() + interval '1 month')::date)"),
+                    {"table": table}
+                )
+    except Exception as e:
+        print(f"❌ Erro ao criar partições: {e}")
 
-async def ml_irrigation_advisor():
+async def poll_weather():
+    """Requisita dados meteorológicos (a cada 2 horas)"""
+    # Envia comando para ESP32 ler estação
+    mqtt_payload = {
+        "action": "read_weather_now",
+        "timestamp": datetime.utcnow().isoformat()
+    }
+    try:
+        await publish_command(mqtt_payload)
+    except MqttUnavailableError as e:
+        print(f"⚠️ Leitura meteorológica não solicitada: {e}")
+
+async def run_ml_advisor():
     """Consultor ML que roda a cada 6 horas para sugerir irrigação"""
-    while True:
-        await asyncio.sleep(21600)  # 6 horas
+    # Analisa se é hora de irrigar baseado em ML
+    print("🤖 ML Advisor: Analisando condições para irrigação...")
+    
+    try:
+        async with get_sessionmaker()() as db:
+            zones = (await db.scalars(_FARM_ZONES)).all()
+            weather = await get_latest_weather(db)
         
-        # Analisa se é hora de irrigar baseado em ML
-        # Esta função pode chamar o endpoint smart_irrigation
-        print("🤖 ML Advisor: Analisando condições para irrigação...")
+        decisions = make_irrigation_decisions(
+            weather, [zone.valves or [] for zone in zones], ml_model
+        )
+        
+        suggestions = [
+            {
+                "zone_id": zone.id,
+                "zone_name": zone.name,
+                "confidence": decision["confidence"],
+                "valves": decision["valves_to_open"],
+                "duration_minutes": decision["duration_minutes"]
+            }
+            for zone, decision in zip(zones, decisions)
+            if decision["should_irrigate"] and decision["valves_to_open"]
+        ]
+        print(f"🤖 ML Advisor: {len(suggestions)} zona(s) para irrigar")
+        
+        if suggestions and arq_pool:
+            await arq_pool.enqueue_job("send_irrigation_report", suggestions)
+    except Exception as e:
+        print(f"❌ Erro ML Advisor: {e}")
@@ -2,7 +2,7 @@
 Modelos SQLAlchemy para PostgreSQL
 """
 
-from sqlalchemy import Column, Integer, String, Float, Boolean, DateTime, ForeignKey, JSON
+from sqlalchemy import Column, Integer, String, Float, Boolean, DateTime, ForeignKey, JSON, Index, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from datetime import datetime
@@ -21,6 +21,8 @@ class SolenoidState(Base):
     # Índice para buscas rápidas
     __table_args__ = (
         Index('idx_valve_time', 'valve_number', 'timestamp'),
+        # Último estado por válvula (DISTINCT ON valve_number ... timestamp DESC)
+        Index('idx_valve_ts_desc', 'valve_number', timestamp.desc()),
     )
 
 class WeatherReading(Base):
@@ -38,6 +40,11 @@ class WeatherReading(Base):
     uv_index = Column(Float)
     timestamp = Column(DateTime, default=datetime.utcnow)
     device_id = Column(String(50))
+    
+    # Leitura mais recente e janelas por período
+    __table_args__ = (
+        Index('idx_weather_ts_desc', timestamp.desc()),
+    )
 
 class IrrigationEvent(Base):
     __tablename__ = "irrigation_events"
@@ -56,6 +63,11 @@ class IrrigationEvent(Base):
     weather_temp = Column(Float)
     weather_humidity = Column(Float)
     soil_moisture = Column(Float)
+    
+    # Última irrigação por zona
+    __table_args__ = (
+        Index('idx_irrig_zone_ts', 'zone_id', timestamp.desc()),
+    )
 
 class IrrigationSchedule(Base):
     __tablename__ = "irrigation_schedules"
@@ -69,6 +81,11 @@ class IrrigationSchedule(Base):
     active = Column(Boolean, default=True)
     weather_dependent = Column(Boolean, default=True)  # Pula se choveu
     created_at = Column(DateTime, default=datetime.utcnow)
+    
+    # Apenas agendamentos ativos
+    __table_args__ = (
+        Index('idx_sched_active', 'valve_number', postgresql_where=text("active")),
+    )
 
 class FarmZone(Base):
     __tablename__ = "farm_zones"
@@ -0,0 +1,24 @@
+"""
+Schemas Pydantic (v2) para validação das requisições
+"""
+
+from datetime import datetime
+from typing import List
+
+from pydantic import BaseModel, ConfigDict, Field
+
+class ValveCommand(BaseModel):
+    model_config = ConfigDict(from_attributes=True, extra="ignore")
+    
+    state: bool  # True=ligar, False=desligar
+    duration_minutes: int = Field(default=0, ge=0)
+
+class IrrigationScheduleCreate(BaseModel):
+    model_config = ConfigDict(from_attributes=True, extra="ignore")
+    
+    valve_number: int = Field(ge=1, le=10)
+    start_time: datetime  # Hora do dia
+    duration_minutes: int = Field(default=30, gt=0)
+    days_of_week: List[int] = []  # [1,3,5] = seg, qua, sex
+    active: bool = True
+    weather_dependent: bool = True  # Pula se choveu
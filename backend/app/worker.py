@@ -0,0 +1,26 @@
+"""
+Worker arq - envio de notificações fora do processo da API
+Executar com: arq app.worker.WorkerSettings
+"""
+
+import os
+
+from arq.connections import RedisSettings
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379")
+
+async def send_alert(ctx, data: dict):
+    """Envia alerta do hardware"""
+    print(f"🚨 ALERTA: {data.get('alert_type')} - Válvula {data.get('valve')}")
+    # Aqui você pode enviar email, SMS, notificação push, etc.
+
+async def send_irrigation_report(ctx, suggestions: list):
+    """Envia relatório com as sugestões do ML Advisor"""
+    for item in suggestions:
+        print(f"🤖 Relatório: irrigar zona {item['zone_id']} ({item['zone_name']}) - "
+              f"confiança {item['confidence']:.2f}")
+    # Aqui você pode enviar email, SMS, notificação push, etc.
+
+class WorkerSettings:
+    functions = [send_alert, send_irrigation_report]
+    redis_settings = RedisSettings.from_dsn(REDIS_URL)
@@ -0,0 +1,16 @@
+-- Índices para as consultas de "último registro" e janelas por período.
+-- Tabelas novas já são criadas com eles (Base.metadata.create_all);
+-- este script é para bancos existentes.
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_valve_ts_desc
+    ON solenoid_states (valve_number, timestamp DESC);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_weather_ts_desc
+    ON weather_readings (timestamp DESC);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_irrig_zone_ts
+    ON irrigation_events (zone_id, timestamp DESC);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_sched_active
+    ON irrigation_schedules (valve_number)
+    WHERE active;
@@ -0,0 +1,97 @@
+-- Particiona por mês (RANGE em timestamp) as séries temporais
+-- solenoid_states e weather_readings.
+-- Consultas com "timestamp >= :since" só leem as partições recentes, e dados
+-- antigos saem com DROP TABLE <partição> em vez de DELETE.
+-- Executar após 001_indexes.sql, em janela de manutenção (copia os dados).
+-- Os modelos ORM não mudam: o particionamento é transparente para a API.
+
+BEGIN;
+
+-- Cria (se não existir) a partição mensal de "parent" que contém "month"
+CREATE OR REPLACE FUNCTION create_monthly_partition(parent text, month date)
+RETURNS void AS $$
+DECLARE
+    start_date date := date_trunc('month', month);
+    end_date date := (date_trunc('month', month) + interval '1 month')::date;
+BEGIN
+    EXECUTE format(
+        'CREATE TABLE IF NOT EXISTS %I PARTITION OF %I FOR VALUES FROM (%L) TO (%L)',
+        parent || '_' || to_char(start_date, 'YYYY_MM'), parent, start_date, end_date
+    );
+END;
+$$ LANGUAGE plpgsql;
+
+-- ---- solenoid_states ----
+
+ALTER TABLE solenoid_states RENAME TO solenoid_states_old;
+ALTER SEQUENCE solenoid_states_id_seq OWNED BY NONE;
+
+-- A chave de partição precisa fazer parte da chave primária
+CREATE TABLE solenoid_states (
+    LIKE solenoid_states_old INCLUDING DEFAULTS,
+    PRIMARY KEY (id, timestamp)
+) PARTITION BY RANGE (timestamp);
+ALTER SEQUENCE solenoid_states_id_seq OWNED BY solenoid_states.id;
+
+SELECT create_monthly_partition('solenoid_states', m::date)
+FROM generate_series(
+    date_trunc('month', (SELECT coalesce(min(timestamp), now()) FROM solenoid_states_old)),
+    date_trunc('month', now()) + interval '1 month',
+    interval '1 month'
+) AS m;
+CREATE TABLE solenoid_states_default PARTITION OF solenoid_states DEFAULT;
+
+INSERT INTO solenoid_states SELECT * FROM solenoid_states_old;
+DROP TABLE solenoid_states_old;
+
+CREATE INDEX ix_solenoid_states_id ON solenoid_states (id);
+CREATE INDEX idx_valve_time ON solenoid_states (valve_number, timestamp);
+CREATE INDEX idx_valve_ts_desc ON solenoid_states (valve_number, timestamp DESC);
+
+-- ---- weather_readings ----
+
+ALTER TABLE weather_readings RENAME TO weather_readings_old;
+ALTER SEQUENCE weather_readings_id_seq OWNED BY NONE;
+
+CREATE TABLE weather_readings (
+    LIKE weather_readings_old INCLUDING DEFAULTS,
+    PRIMARY KEY (id, timestamp)
+) PARTITION BY RANGE (timestamp);
+ALTER SEQUENCE weather_readings_id_seq OWNED BY weather_readings.id;
+
+SELECT create_monthly_partition('weather_readings', m::date)
+FROM generate_series(
+    date_trunc('month', (SELECT coalesce(min(timestamp), now()) FROM weather_readings_old)),
+    date_trunc('month', now()) + interval '1 month',
+    interval '1 month'
+) AS m;
+CREATE TABLE weather_readings_default PARTITION OF weather_readings DEFAULT;
+
+INSERT INTO weather_readings SELECT * FROM weather_readings_old;
+DROP TABLE weather_readings_old;
+
+CREATE INDEX ix_weather_readings_id ON weather_readings (id);
+CREATE INDEX idx_weather_ts_desc ON weather_readings (timestamp DESC);
+
+-- ---- Partição do mês seguinte ----
+-- A API já cria as partições diariamente (job create_next_partitions do
+-- agendador); o pg_cron, se instalado, é uma garantia extra com a API parada.
+
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_cron') THEN
+        RAISE WARNING 'pg_cron não instalado: partições futuras dependem do job create_next_partitions da API (sem ele, novas linhas caem em *_default)';
+    ELSE
+        PERFORM cron.schedule(
+            'agroirriga_next_month_partitions',
+            '0 3 20 * *',  -- dia 20 de cada mês, 03:00
+            $cron$
+            SELECT create_monthly_partition('solenoid_states', (now() + interval '1 month')::date);
+            SELECT create_monthly_partition('weather_readings', (now() + interval '1 month')::date);
+            $cron$
+        );
+    END IF;
+END
+$$;
+
+COMMIT;
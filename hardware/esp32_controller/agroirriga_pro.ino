@@ -226,6 +226,13 @@ void handleMQTTMessage(char* topic, byte* payload, unsigned int length) {
         int duration = doc["duration"] | 0;
         setValve(valve, true, duration);
     }
+    else if (action == "valves_on_bulk") {
+        // Várias válvulas no mesmo comando
+        int duration = doc["duration"] | 0;
+        for (int valve : doc["valves"].as<JsonArray>()) {
+            setValve(valve, true, duration);
+        }
+    }
     else if (action == "valve_off") {
         int valve = doc["valve"] | 0;
         setValve(valve, false);